@@ -4,9 +4,14 @@ import sys
 import os
 import signal
 import socket
+import selectors
+import ssl
 import time
-from datetime import datetime
-import pytz
+import functools
+import types
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 import argparse
 import urllib.parse
 import paho.mqtt.client as mqtt
@@ -18,8 +23,26 @@ import threading
 import logging
 from logging.handlers import RotatingFileHandler
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# resolved once instead of on every dispatched message
+_UTC = timezone.utc
+
+# payload serializer returning bytes: orjson when it is installed, the stdlib json module otherwise
+if orjson is not None:
+    _json_dumps = orjson.dumps
+else:
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
+
 base_path: str
 args: argparse.Namespace
+dispatch_uri: DispatchUri
 dispatcher_type: type[MqttDispatcher]
 main_logger: logging.Logger
 killer: GracefulKiller
@@ -30,13 +53,22 @@ class GracefulKiller:
 
     def __init__(self):
         self.kill_now = False
+        # set together with kill_now so worker threads sleeping in wait() return immediately
+        self.wake = threading.Event()
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
 
     def exit_gracefully(self, *args):
         self.kill_now = True
+        self.wake.set()
         main_logger.info("Caught signal, mochad_dispatch is exiting...")
 
+    def wait(self, timeout=None):
+        """
+        Sleep for up to timeout seconds from a worker thread.  Returns True as soon as shutdown has started
+        """
+        return self.wake.wait(timeout)
+
     def do_kill_now(self):
         os.kill(os.getpid(), signal.SIGTERM)
 
@@ -46,48 +78,136 @@ class GracefulKiller:
         """
         global main_logger
         prog = os.path.basename(sys.argv[0])
-        main_logger.error("{}: error: {}\n".format(prog, message))
+        main_logger.error("%s: error: %s\n", prog, message)
         self.do_kill_now()
 
 
 class SocketReader:
+    __slots__ = ("host", "port", "sock", "_selector", "_buf", "_view", "_lo", "_hi")
+
+    # mochad lines are well under 100 bytes, so one buffer holds a whole burst of them
+    BUFFER_SIZE = 8192
+    RCVBUF_SIZE = 256 * 1024
+    KEEPIDLE_SECONDS = 30
+
     def __init__(self, host, port):
         self.host = host
         self.port = port
         self.sock = None
-        self.sock_file = None
+        # registered with the socket on the first timed read and kept for the life of the connection
+        self._selector = None
+        # unread data lives in self._buf[self._lo:self._hi]
+        self._buf = bytearray(self.BUFFER_SIZE)
+        self._view = memoryview(self._buf)
+        self._lo = 0
+        self._hi = 0
 
     def open_connection(self):
-        """Open the socket and prepare the file-like object."""
+        """Open the socket and reset the line buffer."""
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # a roomy kernel buffer absorbs event bursts between reads; it has to be set before connect() to
+            # influence the TCP window
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RCVBUF_SIZE)
             self.sock.connect((self.host, self.port))
-            self.sock_file = self.sock.makefile("r")
+            # mochad sends short event lines; make sure Nagle never holds any of them back
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # mochad can stay quiet for hours; let the kernel notice a dead peer instead of blocking forever
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                # the default idle time before the first probe is two hours
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.KEEPIDLE_SECONDS)
+            self._lo = self._hi = 0
         except Exception as e:
-            raise Exception("Could not connect to {}: {}".format(self.host, e))
+            raise OSError("Could not connect to {}: {}".format(self.host, e)) from e
 
-    def read_line(self):
-        """Read a single line from the socket."""
-        if self.sock_file:
-            return self.sock_file.readline().strip()
-        else:
+    def read_line(self, timeout=None):
+        """
+        Read a single line from the socket.  Returns an empty bytes object once the connection is closed, or None if
+        timeout seconds pass without a complete line.  Blank lines are skipped so they can't be mistaken for EOF
+        """
+        if not self.sock:
             raise ValueError("Connection is not open. Call open_connection first.")
+        while True:
+            end = self._buf.find(b"\n", self._lo, self._hi)
+            if end >= 0:
+                line = bytes(self._view[self._lo : end]).strip()
+                self._lo = end + 1
+                if line:
+                    return line
+                continue
 
-    def read_to_eof(self):
-        """Read all remaining content until EOF."""
-        if self.sock_file:
-            return self.sock_file.read()
-        else:
-            raise ValueError("Connection is not open. Call open_connection first.")
+            # no complete line buffered: move the partial line to the front to make room for the next recv
+            if self._lo:
+                pending = self._hi - self._lo
+                self._view[:pending] = self._view[self._lo : self._hi]
+                self._lo, self._hi = 0, pending
+            if self._hi == len(self._buf):
+                # a full buffer without a newline is not mochad output; hand it back rather than grow the buffer
+                line = bytes(self._view).strip()
+                self._hi = 0
+                if line:
+                    return line
+                continue
+
+            if timeout is not None:
+                if self._selector is None:
+                    self._selector = selectors.DefaultSelector()
+                    self._selector.register(self.sock, selectors.EVENT_READ)
+                if not self._selector.select(timeout):
+                    return None
+            n = self.sock.recv_into(self._view[self._hi :])
+            if not n:
+                # connection closed: hand back whatever partial line is left, then b"" once nothing is buffered
+                line = bytes(self._view[: self._hi]).strip()
+                self._hi = 0
+                return line
+            self._hi += n
 
     def close_connection(self):
-        """Close the socket and associated file."""
-        if self.sock_file:
-            self.sock_file.close()
+        """Close the socket."""
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
         if self.sock:
             self.sock.close()
 
 
+@dataclass(frozen=True)
+class DispatchUri:
+    """
+    Broker connection settings parsed from the dispatch_uri command line argument
+    """
+
+    host: str
+    port: int
+    user: str = ""
+    password: str = field(default="", repr=False)
+    scheme: str = "mqtt"
+
+
+def parse_dispatch_uri(dispatch_uri):
+    """
+    Parse a dispatch URI of the form mqtt://host:port[,user=username,pass=password]
+    """
+    real_uri, _, params = dispatch_uri.partition(",")
+    options = {}
+    if params:
+        for param in params.split(","):
+            key, sep, value = param.partition("=")
+            if not sep or key not in ("user", "pass"):
+                raise ValueError("Unknown dispatch URI parameter: {}".format(param))
+            options[key] = value
+    uri = urllib.parse.urlparse(real_uri)
+    return DispatchUri(
+        host=uri.hostname,
+        port=uri.port if uri.port else 1883,
+        user=options.get("user", ""),
+        password=options.get("pass", ""),
+        scheme=uri.scheme,
+    )
+
+
 class MqttDispatcher:
     """
     MqttDispatcher object
@@ -95,115 +215,280 @@ class MqttDispatcher:
     Used by MochadClient object to dispatch messages via MQTT
 
     :param mochad_host: The hostname of the mochad server.  This will be used in the topic name
-    :param dispatch_uri: The URI that describes an MQTT broker.  Messages dispatched from MochadClient will be
+    :param dispatch_uri: DispatchUri describing an MQTT broker.  Messages dispatched from MochadClient will be
         published to this broker.
     :param logger: Logger object to use
     :param cafile: The file containing trusted CA certificates.  Specifying this will enable SSL/TLS encryption
         to the MQTT broker
     """
 
+    __slots__ = (
+        "mochad_host",
+        "logger",
+        "killer",
+        "legacy",
+        "mqtt_discovery",
+        "mqtt_ha_id",
+        "devices_discovered",
+        "topic_prefix",
+        "config_topic_prefix",
+        "topic_cache",
+        "retained_discovery",
+        "host",
+        "port",
+        "mqttc",
+        "reconnect_time",
+        "reconnect_timer",
+        "held_states",
+        "held_mids",
+        "early_acks",
+        "holding",
+        "held_lock",
+    )
+
+    # (qos, retain) per message kind.  Button presses are momentary so they are neither retained nor re-sent; any
+    # other kind is device state
+    QOS_RETAIN = {
+        "security": (1, True),
+        "button": (0, False),
+    }
+
+    # QoS 1 messages pile up in paho's outgoing queue while the broker is unreachable; cap it so a long outage can't
+    # grow memory without bound
+    MAX_QUEUED_MESSAGES = 1000
+
+    # Home Assistant subscribes to a new device's state topic only after it has processed the discovery config, so
+    # the device's first state is published this many seconds after the broker acknowledges the config
+    DISCOVERY_STATE_DELAY = 1
+
     def __init__(self, mochad_host, dispatch_uri, logger, cafile, killer, legacy, mqtt_discovery):
-        user, password = "", ""
-        if "," in dispatch_uri:
-            real_uri = dispatch_uri.split(",")[0]
-            if "user" in dispatch_uri and "pass" in dispatch_uri:
-                user = dispatch_uri.split(",")[1].split("=")[1]
-                password = dispatch_uri.split(",")[2].split("=")[1]
-                logger.debug(f"real_uri: {real_uri}, user: {user}, password: {password}")
-        else:
-            real_uri = dispatch_uri
-        uri = urllib.parse.urlparse(real_uri)
         self.mochad_host = mochad_host
         self.logger = logger
         self.killer = killer
         self.legacy = legacy
         self.mqtt_discovery = mqtt_discovery.split("/")[0]
         self.mqtt_ha_id = mqtt_discovery.split("/")[1]
-        self.devices_discovered = {}
-        self.host = uri.hostname
-        self.port = uri.port if uri.port else 1883
+        self.devices_discovered = set()
+        # the fixed part of every topic only depends on startup arguments
+        if legacy:
+            self.topic_prefix = f"X10/{mochad_host}/"
+        else:
+            self.topic_prefix = f"X10/{self.mqtt_ha_id}/"
+        self.config_topic_prefix = f"{self.mqtt_discovery}/device/{self.mqtt_ha_id}/"
+        # state topics keyed by (kind, addr)
+        self.topic_cache = {}
+        # discovery configs the broker has retained from a previous run, keyed by device address
+        self.retained_discovery = {}
+        self.host = dispatch_uri.host
+        self.port = dispatch_uri.port
         mqtt_client_id = "mochadc/{}-{}".format(os.getpid(), socket.gethostname())
-        self.logger.info(f"mqtt_client_id: {mqtt_client_id}, mqtt host: {self.host}, mqtt port: {self.port}")
+        self.logger.info("mqtt_client_id: %s, mqtt host: %s, mqtt port: %s", mqtt_client_id, self.host, self.port)
         self.mqttc = mqtt.Client(CallbackAPIVersion.VERSION2, mqtt_client_id)
-        if user and password:
-            self.logger.info(f"mqtt connection with username and password.")
-            self.mqttc.username_pw_set(user, password)
+        self.mqttc.max_queued_messages_set(self.MAX_QUEUED_MESSAGES)
+        if dispatch_uri.user and dispatch_uri.password:
+            self.logger.info("mqtt connection with username and password.")
+            self.mqttc.username_pw_set(dispatch_uri.user, dispatch_uri.password)
 
-        self.logger.debug("self.mqttc: {}".format(self.mqttc))
+        self.logger.debug("self.mqttc: %s", self.mqttc)
         # connection error handling
         self.reconnect_time = -1
-
-        def on_connect(client, userdata, flags, rc, properties):
-            self.reconnect_time = 0
-
-        def on_disconnect(client, userdata, flags, rc, properties):
-            if self.reconnect_time == -1:
-                # Why suggest SSL here?  If on_disconnect is called BEFORE on_connect that means the socket initially
-                # connected but failed BEFORE getting to the MQTT-specific negotiation.  To my knowledge only SSL
-                # happens in between those two
-                self.logger.error("Could not connect to MQTT broker: possibly SSL/TLS failure")
-                self.killer.do_kill_now()
-            elif self.reconnect_time == 0:
-                self.reconnect_time = time.time()
-
-        self.mqttc.on_connect = on_connect
-        self.mqttc.on_disconnect = on_disconnect
+        self.reconnect_timer = None
+        # state messages of newly discovered devices, in arrival order, keyed by device address.  They wait for the
+        # broker to acknowledge the device's config; held_mids maps that config's mid back to the address
+        self.held_states = {}
+        self.held_mids = {}
+        # acks that arrived while a config was still being handed to paho, before its mid was known
+        self.early_acks = set()
+        self.holding = False
+        self.held_lock = threading.Lock()
+
+        self.mqttc.on_connect = self.on_connect
+        self.mqttc.on_disconnect = self.on_disconnect
+        self.mqttc.on_message = self.on_message
+        self.mqttc.on_publish = self.on_publish
 
         # configure TLS if argument "cafile" is given
         if cafile:
-            self.mqttc.tls_set(cafile)
+            # build the context once so the CA bundle is loaded a single time and reconnects share it
+            context = ssl.create_default_context(cafile=cafile)
+            context.minimum_version = ssl.TLSVersion.TLSv1_2
+            self.mqttc.tls_set_context(context)
 
         try:
             rc = self.mqttc.connect(self.host, self.port)
-            self.logger.info(f"mqtt connect return code: {rc}")
+            self.logger.info("mqtt connect return code: %s", rc)
         except Exception as e:
             raise Exception("Could not connect to MQTT broker: {}".format(e))
         self.mqttc.loop_start()
 
+    def on_connect(self, client, userdata, flags, rc, properties):
+        """
+        paho callback: (re)connected to the broker
+        """
+        self.reconnect_time = 0
+        if self.reconnect_timer is not None:
+            self.reconnect_timer.cancel()
+            self.reconnect_timer = None
+        # events are small, single packet publishes; don't let Nagle delay them waiting for an ACK
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if not self.legacy:
+            # the broker replays retained discovery configs so already-known devices are not published again
+            client.subscribe(f"{self.config_topic_prefix}+/config", qos=1)
+
+    def on_message(self, client, userdata, message):
+        """
+        paho callback: remember discovery configs the broker replays for our devices
+        """
+        if message.topic.startswith(self.config_topic_prefix) and message.topic.endswith("/config"):
+            addr = message.topic[len(self.config_topic_prefix) : -len("/config")]
+            self.retained_discovery[addr] = message.payload
+
+    def on_disconnect(self, client, userdata, flags, rc, properties):
+        """
+        paho callback: lost the broker connection, or never finished connecting
+        """
+        if self.reconnect_time == -1:
+            # Why suggest SSL here?  If on_disconnect is called BEFORE on_connect that means the socket initially
+            # connected but failed BEFORE getting to the MQTT-specific negotiation.  To my knowledge only SSL
+            # happens in between those two
+            self.logger.error("Could not connect to MQTT broker: possibly SSL/TLS failure")
+            self.killer.do_kill_now()
+        elif self.reconnect_time == 0:
+            self.reconnect_time = time.time()
+            self.reconnect_timer = threading.Timer(60, self.reconnect_timeout)
+            self.reconnect_timer.daemon = True
+            self.reconnect_timer.start()
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        """
+        paho callback: a message was sent (QoS 0) or acknowledged by the broker (QoS 1).  Releases the state held
+        back for a newly discovered device
+        """
+        with self.held_lock:
+            addr = self.held_mids.pop(mid, None)
+            if addr is None and self.holding:
+                self.early_acks.add(mid)
+        if addr is not None:
+            self.release_held(addr)
+
     def dispatch_message(self, addr, message_dict, kind):
         """
         Publish a dict to an MQTT broker in JSON format
         """
-        if self.legacy:
-            # X10 topic format
-            #    X10/MOCHAD_HOST/security/DEVICE_ADDRESS
-            #
-            # (based on discussion at below URL)
-            # https://groups.google.com/forum/#!topic/homecamp/sWqHvQnLvV0
-            topic = f"X10/{self.mochad_host}/{kind}/{addr}"
-            payload = json.dumps(message_dict)
-            # Distinguish between status messages (security) and
-            # button presses per Andy Stanford-Clark's suggestion at
-            # https://groups.google.com/d/msg/mqtt/rIp1uJsT9Nk/7YOWNCQO3ZEJ
-        else:
-            if self.devices_discovered.get(addr) is None:
-                self.devices_discovered[addr] = True
-                self.dispatch_mqtt_discovery(kind, addr)
-                time.sleep(1)
-
-            # Home Assistant MQTT auto discovery format
-            #    homeassistant/device_automation/HA_ID/mochad_dispatch/config
-            #    {
-            #        "action": "publish",
-            #        "topic": "X10/mqtt_ha_id/button/DEVICE_ADDRESS",
-            #        "payload": {
-            #            "state": "ON"
-            #        }
-            #    }
-            topic = f"X10/{self.mqtt_ha_id}/{kind}/{addr}"
-            payload = json.dumps(message_dict)
-        if kind == "button":
-            qos, retain = 0, False
-        else:
-            qos, retain = 1, True
-        result, mid = self.mqttc.publish(topic, payload, qos=qos, retain=retain)
-        pass
+        # legacy X10 topic format
+        #    X10/MOCHAD_HOST/security/DEVICE_ADDRESS
+        #
+        # (based on discussion at below URL)
+        # https://groups.google.com/forum/#!topic/homecamp/sWqHvQnLvV0
+        #
+        # Home Assistant MQTT auto discovery format
+        #    homeassistant/device_automation/HA_ID/mochad_dispatch/config
+        #    {
+        #        "action": "publish",
+        #        "topic": "X10/mqtt_ha_id/button/DEVICE_ADDRESS",
+        #        "payload": {
+        #            "state": "ON"
+        #        }
+        #    }
+        topic = self.topic(kind, addr)
+        payload = _json_dumps(message_dict)
+        # Distinguish between status messages (security) and
+        # button presses per Andy Stanford-Clark's suggestion at
+        # https://groups.google.com/d/msg/mqtt/rIp1uJsT9Nk/7YOWNCQO3ZEJ
+        qos, retain = self.QOS_RETAIN.get(kind, (1, True))
+
+        # holds are only created on this thread, so an empty held_states can be trusted without the lock.  It is
+        # always empty in legacy mode
+        if self.held_states:
+            with self.held_lock:
+                held = self.held_states.get(addr)
+                if held is not None:
+                    # the device's first state is still waiting for its config; queue this one behind it
+                    held.append((topic, payload, qos, retain))
+                    return
+        if not self.legacy and addr not in self.devices_discovered:
+            # a button state is neither retained nor re-sent, and Home Assistant isn't listening for it until it
+            # has processed the config: hand the state to the config publish rather than sending it now.
+            # Sleeping here instead would stall the mochad reader, and wouldn't help while the broker is away
+            if self.dispatch_mqtt_discovery(kind, addr, (topic, payload, qos, retain)):
+                return
+        self.publish(topic, payload, qos, retain)
+
+    def publish(self, topic, payload, qos, retain):
+        """
+        Hand a message to paho's network thread.  Returns paho's MQTTMessageInfo, or None if the message was dropped
+        because the outgoing queue is full
+        """
+        info = self.mqttc.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+            self.logger.warning("MQTT outgoing queue is full, dropping message for %s", topic)
+            return None
+        return info
+
+    def publish_and_hold(self, topic, payload, addr, first_state):
+        """
+        Publish a device's retained QoS 1 config and hold back first_state, a (topic, payload, qos, retain) message,
+        and any later states of the device until the broker has acknowledged it.  Returns False, holding nothing, if
+        the config was dropped
+        """
+        with self.held_lock:
+            self.holding = True
+            self.held_states[addr] = [first_state]
+        info = self.publish(topic, payload, 1, True)
+        with self.held_lock:
+            self.holding = False
+            acked = info is not None and info.mid in self.early_acks
+            self.early_acks.clear()
+            if info is None:
+                del self.held_states[addr]
+                return False
+            if not acked:
+                self.held_mids[info.mid] = addr
+                return True
+        self.release_held(addr)
+        return True
+
+    def release_held(self, addr):
+        """
+        Publish a device's held states once Home Assistant has had time to subscribe to them
+        """
+        timer = threading.Timer(self.DISCOVERY_STATE_DELAY, self.publish_held, (addr,))
+        timer.daemon = True
+        timer.start()
 
-    def dispatch_mqtt_discovery(self, kind, addr):
+    def publish_held(self, addr):
         """
-        Publish Home Assistant MQTT discovery message
+        Publish a device's held states in order, then let its states go straight out
         """
-        topic = f"X10/{self.mqtt_ha_id}/{kind}/{addr}"
+        while True:
+            # paho calls on_publish with its own lock held, so never publish while holding held_lock
+            with self.held_lock:
+                held = self.held_states[addr]
+                if not held:
+                    del self.held_states[addr]
+                    return
+                self.held_states[addr] = []
+            for message in held:
+                self.publish(*message)
+
+    def topic(self, kind, addr):
+        """
+        State topic for a device.  A home only has a handful of (kind, addr) pairs, so each topic is built once and
+        cached
+        """
+        key = (kind, addr)
+        topic = self.topic_cache.get(key)
+        if topic is None:
+            topic = self.topic_cache[key] = f"{self.topic_prefix}{kind}/{addr}"
+        return topic
+
+    def dispatch_mqtt_discovery(self, kind, addr, first_state=None):
+        """
+        Publish Home Assistant MQTT discovery message.  Returns True if first_state, a (topic, payload, qos, retain)
+        message, is held back until the broker has acknowledged the config; False means the caller should publish it.
+        The device only counts as discovered once its config is queued or already retained by the broker
+        """
+        topic = self.topic(kind, addr)
         dev_id = f"{self.mqtt_ha_id}_{addr}"
         cmp_id = f"{dev_id}_state"
         payload = {
@@ -226,29 +511,108 @@ class MqttDispatcher:
             },
             "state_topic": topic,
         }
-        config_topic = f"{self.mqtt_discovery}/device/{self.mqtt_ha_id}/{addr}/config"
+        config_topic = f"{self.config_topic_prefix}{addr}/config"
+        payload = _json_dumps(payload)
+
+        # the broker already retains this exact config, publishing it again would only make Home Assistant reload it
+        if self.retained_discovery.get(addr) == payload:
+            self.devices_discovered.add(addr)
+            return False
 
-        qos, retain = 1, True
-        result, mid = self.mqttc.publish(config_topic, json.dumps(payload), qos=qos, retain=retain)
-        pass
+        if first_state is None:
+            held = False
+            queued = self.publish(config_topic, payload, 1, True) is not None
+        else:
+            held = queued = self.publish_and_hold(config_topic, payload, addr, first_state)
+        # a config dropped because paho's queue was full is retried with the device's next message
+        if queued:
+            self.devices_discovered.add(addr)
+        return held
 
-    def watchdog(self):
+    def reconnect_timeout(self):
         """
-        Continually watches the MQTT broker connection health.  Exits gracefully if the connection is retried for 60
-        seconds straight without success.
+        Called by reconnect_timer when the MQTT broker connection has been retried for 60 seconds straight without
+        success.  Exits gracefully.
 
-        Why not just do this in the on_disconnect callback?  The on_disconnect callback is not called while
-        loop_start/loop_forever is doing an automatic reconnect.  This makes it impossible to use on_disconnect to
-        handle reconnect issues in the loop_start/loop_forever functions.
+        Why a timer armed in on_disconnect?  on_disconnect is only called once when the connection drops, not for
+        every failed attempt while loop_start is doing its automatic reconnect, so the timer covers the whole
+        reconnect period and on_connect disarms it.
         """
-        while self.killer.kill_now == False:
-            if self.reconnect_time > 0 and time.time() - self.reconnect_time > 60:
+        if self.reconnect_time > 0:
+            self.logger.error("Could not reconnect to MQTT broker after 60s")
+            self.killer.do_kill_now()
+
+
+MOTION_DOOR_WINDOW_SENSORS = frozenset(("DS10A", "DS12A", "MS10A", "SP554A"))
+SECURITY_REMOTES = frozenset(("KR10A", "KR15A", "SH624"))
+
+# Func parameters that span two tokens, keyed on (token, next token).  A next token of None means the token is
+# the last one.  Values are (key, legacy value, value, tokens consumed)
+_FUNC_PAIRS = {
+    # Home/Away switch on SP554A
+    ("Home", "Away"): ("home_away", True, True, 2),
+    # Arm system
+    ("Arm", None): ("command", "arm", "arm", 1),
+    # Arm system in Home or Away mode
+    ("Arm", "Home"): ("command", "arm_home", "armed_home", 2),
+    ("Arm", "Away"): ("command", "arm_away", "armed_away", 2),
+    # Lights on/off
+    ("Lights", "On"): ("command", "lights_on", "lights_on", 2),
+    ("Lights", "Off"): ("command", "lights_off", "lights_off", 2),
+}
+
+# single token Func parameters.  Values are (key, legacy value, value, tokens consumed)
+_FUNC_TOKENS = {
+    # delay setting
+    "min": ("delay", "min", "min", 1),
+    "max": ("delay", "max", "max", 1),
+    # tamper detection
+    "tamper": ("tamper", True, True, 1),
+    # low battery
+    "low": ("low_battery", True, True, 1),
+    # Disarm system
+    "Disarm": ("command", "disarm", "disarming", 1),
+    # Panic
+    "Panic": ("command", "panic", "panic", 1),
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _decode_func(legacy, raw_func):
+    """
+    Decode the "Func:" parameter of an RFSEC message.  A home only produces a few dozen distinct Func values, so
+    results are cached and returned read-only
+    """
+    func_list = raw_func.split("_")
+    func_dict = dict()
+
+    func_dict["device_type"] = func_list.pop()
+
+    # set event_type and event_state for motion and door/window sensors
+    if func_dict["device_type"] in MOTION_DOOR_WINDOW_SENSORS:
+        func_dict["event_type"] = func_list[0].lower()
+        func_dict["event_state"] = func_list[1]
+        i = 2
+    elif func_dict["device_type"] in SECURITY_REMOTES:
+        i = 0
+    else:
+        raise Exception("Unknown device type in {}: {}".format(raw_func, func_dict["device_type"]))
 
-                self.logger.error("Could not reconnect to MQTT broker after 60s")
-                self.killer.do_kill_now()
-                break
-            else:
-                time.sleep(1)
+    # crawl through rest of func parameters
+    func_len = len(func_list)
+    while i < func_len:
+        token = func_list[i]
+        next_token = func_list[i + 1] if i + 1 < func_len else None
+        entry = _FUNC_PAIRS.get((token, next_token))
+        if entry is None:
+            entry = _FUNC_TOKENS.get(token)
+            if entry is None:
+                raise Exception("Unknown func parameter in {}: {}".format(raw_func, token))
+        key, legacy_value, value, consumed = entry
+        func_dict[key] = legacy_value if legacy else value
+        i += consumed
+
+    return types.MappingProxyType(func_dict)
 
 
 class MochadClient:
@@ -263,67 +627,100 @@ class MochadClient:
 
     """
 
-    pl_houseunit: str
-    reader: SocketReader
+    __slots__ = (
+        "host",
+        "logger",
+        "reconnect_time",
+        "dispatcher",
+        "house_codes",
+        "killer",
+        "legacy",
+        "reader",
+        "pl_houseunit",
+        "_time_second",
+        "_time_prefix",
+    )
+
+    pl_houseunit: str | None
+    reader: SocketReader | None
 
     def __init__(self, host, logger, dispatcher, house_codes, killer, legacy):
         self.host = host
         self.logger = logger
         self.reconnect_time = -1
         self.dispatcher = dispatcher
-        self.house_codes = house_codes
+        # checked on every RF and PL line; a set makes that a hash lookup instead of a substring search
+        self.house_codes = frozenset(house_codes)
         self.killer = killer
         self.legacy = legacy
+        self.reader = None
+        self.pl_houseunit = None
+        self._time_second = None
+        self._time_prefix = ""
 
-    def parse_mochad_line(self, line):
+    def _handle_rfsec(self, parts):
         """
-        Parse a raw line of output from mochad
+        Handle an RFSEC line.  Format is either:
+          09/22 15:39:07 Rx RFSEC Addr: 21:26:80 Func: Contact_alert_min_DS10A
+            ~ or ~
+          09/22 15:39:07 Rx RFSEC Addr: 0x80 Func: Motion_alert_SP554A
         """
-        if type(line) == bytes:
-            line = line.decode()
-
-        if line[15:23] == "Rx RFSEC":
+        addr = parts[5].decode("ascii")
+        func = parts[7].decode("ascii")
 
-            # decode message. format is either:
-            #   09/22 15:39:07 Rx RFSEC Addr: 21:26:80 Func: Contact_alert_min_DS10A
-            #     ~ or ~
-            #   09/22 15:39:07 Rx RFSEC Addr: 0x80 Func: Motion_alert_SP554A
-            line_list = line.split(" ")
-            addr = line_list[5]
-            func = line_list[7]
+        func_dict = self.decode_func(self.legacy, func)
 
-            func_dict = self.decode_func(self.legacy, func)
+        return addr, func_dict, "security"
 
-            return addr, func_dict, "security"
-
-        elif line[16:20] == "x RF":
-
-            # decode RF message. format is:
-            #   02/13 23:54:28 Rx RF HouseUnit: B1 Func: On
-            #   12/15 21:30:45 Tx RF HouseUnit: A4 Func: On\n
-            line_list = line.split(" ")
-            house_code = line_list[5]
-            hc = house_code[0:1]
-            if hc in self.house_codes:
-                house_func = line_list[7]
-                return house_code, self.create_state_payload(house_func), "button"
+    def _handle_rf(self, parts):
+        """
+        Handle an RF line.  Format is:
+          02/13 23:54:28 Rx RF HouseUnit: B1 Func: On
+          12/15 21:30:45 Tx RF HouseUnit: A4 Func: On
+        """
+        house_code = parts[5].decode("ascii")
+        hc = house_code[0:1]
+        if hc in self.house_codes:
+            house_func = parts[7].decode("ascii")
+            return house_code, self.create_state_payload(house_func), "button"
+        return "", "", ""
 
-        elif line[15:20] == "Rx PL":
+    def _handle_pl(self, parts):
+        """
+        Handle a PL line.  Format is in 2 parts:
+          02/13 23:54:28 Rx PL HouseUnit: B1
+          02/13 23:54:28 Rx PL House: B Func: On
+        """
+        if parts[4] == b"HouseUnit:":
+            house_unit = parts[5].decode("ascii")
+            if house_unit[0:1] in self.house_codes:
+                self.pl_houseunit = house_unit
+        if parts[4] == b"House:" and self.pl_houseunit != None:
+            house_func = parts[7].decode("ascii")
+            house_unit = self.pl_houseunit
+            return house_unit, self.create_state_payload(house_func), "button"
+        return "", "", ""
 
-            # decode PL message. format is in 2 parts:
-            #   02/13 23:54:28 Rx PL HouseUnit: B1
-            #   02/13 23:54:28 Rx PL House: B Func: On
-            line_list = line.split(" ")
-            if line_list[4] == "HouseUnit:":
-                hc = line_list[5][0:1]
-                if hc in self.house_codes:
-                    self.pl_houseunit = line_list[5]
-            if line_list[4] == "House:" and self.pl_houseunit != None:
-                house_func = line_list[7]
-                house_unit = self.pl_houseunit
-                return house_unit, self.create_state_payload(house_func), "button"
+    # line handlers keyed on the (direction, protocol) tokens of a mochad line
+    _DISPATCH = {
+        (b"Rx", b"RFSEC"): _handle_rfsec,
+        (b"Rx", b"RF"): _handle_rf,
+        (b"Tx", b"RF"): _handle_rf,
+        (b"Rx", b"PL"): _handle_pl,
+    }
 
-        return "", "", ""
+    def parse_mochad_line(self, line):
+        """
+        Parse a raw line of output from mochad, as bytes from SocketReader.read_line.  Only the fields that get
+        dispatched are decoded
+        """
+        # date, time, direction, protocol, then the message specific fields; splitting on runs of whitespace
+        # keeps the field positions stable if mochad pads a column
+        parts = line.split(None, 7)
+        handler = self._DISPATCH.get(tuple(parts[2:4]))
+        if handler is None:
+            return "", "", ""
+        return handler(self, parts)
 
     def create_state_payload(self, the_function):
         """
@@ -339,86 +736,23 @@ class MochadClient:
     @staticmethod
     def decode_func(legacy, raw_func):
         """
-        Decode the "Func:" parameter of an RFSEC message
+        Decode the "Func:" parameter of an RFSEC message.  Returns a new dict the caller may modify
         """
-        MOTION_DOOR_WINDOW_SENSORS = ["DS10A", "DS12A", "MS10A", "SP554A"]
-        SECURITY_REMOTES = ["KR10A", "KR15A", "SH624"]
-        func_list = raw_func.split("_")
-        func_dict = dict()
+        return dict(_decode_func(legacy, raw_func))
 
-        func_dict["device_type"] = func_list.pop()
-
-        # set event_type and event_state for motion and door/window sensors
-        if func_dict["device_type"] in MOTION_DOOR_WINDOW_SENSORS:
-            func_dict["event_type"] = func_list[0].lower()
-            func_dict["event_state"] = func_list[1]
-            i = 2
-        elif func_dict["device_type"] in SECURITY_REMOTES:
-            i = 0
-        else:
-            raise Exception("Unknown device type in {}: {}".format(raw_func, func_dict["device_type"]))
-
-        # crawl through rest of func parameters
-        while i < len(func_list):
-            # delay setting
-            if func_list[i] == "min" or func_list[i] == "max":
-                func_dict["delay"] = func_list[i]
-            # tamper detection
-            elif func_list[i] == "tamper":
-                func_dict["tamper"] = True
-            # low battery
-            elif func_list[i] == "low":
-                func_dict["low_battery"] = True
-            # Home/Away switch on SP554A
-            elif func_list[i] == "Home" and func_list[i + 1] == "Away":
-                func_dict["home_away"] = True
-                # skip over 'Away' in func_list
-                i += 1
-            # Arm system
-            elif func_list[i] == "Arm" and i + 1 == len(func_list):
-                func_dict["command"] = "arm"
-            # Arm system in Home mode
-            elif func_list[i] == "Arm" and func_list[i + 1] == "Home":
-                if legacy:
-                    func_dict["command"] = "arm_home"
-                else:
-                    func_dict["command"] = "armed_home"
-                # skip over 'Home' in func_list
-                i += 1
-            # Arm system in Away mode
-            elif func_list[i] == "Arm" and func_list[i + 1] == "Away":
-                if legacy:
-                    func_dict["command"] = "arm_away"
-                else:
-                    func_dict["command"] = "armed_away"
-                # skip over 'Away' in func_list
-                i += 1
-            # Disarm system
-            elif func_list[i] == "Disarm":
-                if legacy:
-                    func_dict["command"] = "disarm"
-                else:
-                    func_dict["command"] = "disarming"
-            # Panic
-            elif func_list[i] == "Panic":
-                func_dict["command"] = "panic"
-            # Lights on
-            elif func_list[i] == "Lights" and func_list[i + 1] == "On":
-                func_dict["command"] = "lights_on"
-                # skip ovedr 'On' in func_list
-                i += 1
-            # Lights off
-            elif func_list[i] == "Lights" and func_list[i + 1] == "Off":
-                func_dict["command"] = "lights_off"
-                # skip ovedr 'Off' in func_list
-                i += 1
-            # unknown
-            else:
-                raise Exception("Unknown func parameter in {}: {}".format(raw_func, func_list[i]))
-
-            i += 1
-
-        return func_dict
+    def dispatch_time(self):
+        """
+        Current UTC time in the same ISO 8601 form as datetime.now(timezone.utc).isoformat().  Everything up to the
+        seconds only changes once a second, so that part is formatted once and reused
+        """
+        second, nanos = divmod(time.time_ns(), 1_000_000_000)
+        if second != self._time_second:
+            self._time_second = second
+            self._time_prefix = datetime.fromtimestamp(second, _UTC).strftime("%Y-%m-%dT%H:%M:%S")
+        micros = nanos // 1000
+        if micros:
+            return f"{self._time_prefix}.{micros:06d}+00:00"
+        return f"{self._time_prefix}+00:00"
 
     def connect(self):
         """
@@ -432,7 +766,7 @@ class MochadClient:
         try:
             self.reader.open_connection()
         except Exception as e:
-            self.logger.error("Could not connect to mochad: {}".format(e))
+            self.logger.error("Could not connect to mochad: %s", e)
             raise
 
     def dispatch_message(self, addr, message_dict, kind):
@@ -442,18 +776,23 @@ class MochadClient:
         try:
             self.dispatcher.dispatch_message(addr, message_dict, kind)
         except Exception as e:
-            self.logger.error("Failed to dispatch mochad message {}: {}".format(message_dict, e))
+            self.logger.error("Failed to dispatch mochad message %s: %s", message_dict, e)
 
     def worker(self):
         """
         Maintain the connection to mochad, read output from mochad and dispatch any RFSEC messages
         """
 
+        # number of reconnect attempts since the last successful connect
+        attempt = 0
+
         # CONNECTION LOOP
         while self.killer.kill_now == False:
-            # if we are in reconnect status, sleep before connecting
+            # if we are in reconnect status, back off (1s, 2s, 4s, 8s max plus jitter) before connecting
             if self.reconnect_time > 0:
-                time.sleep(1)
+                if self.killer.wait(min(2**attempt, 8) + random.random()):
+                    break
+                attempt += 1
 
                 # if we've been reconnecting for over 60s, bail out
                 if (time.time() - self.reconnect_time) > 60:
@@ -465,10 +804,10 @@ class MochadClient:
             except OSError as e:
                 if self.reconnect_time == 0:
                     self.reconnect_time = time.time()
-                    self.logger.warn("Could not connect to mochad. Retrying: {}".format(e))
+                    self.logger.warning("Could not connect to mochad. Retrying: %s", e)
                 # reconnect_time = -1 here means the first connection failed
                 elif self.reconnect_time == -1:
-                    self.logger.error("Could not connect to mochad: {}".format(e))
+                    self.logger.error("Could not connect to mochad: %s", e)
                     self.killer.do_kill_now()
                     break
 
@@ -478,29 +817,47 @@ class MochadClient:
             # if we make it this far we've successfully connected, reset the
             # reconnect time
             self.reconnect_time = 0
-            self.logger.info(f"Connected to mochad host: {self.host}")
+            attempt = 0
+            self.logger.info("Connected to mochad host: %s", self.host)
+
+            # bind the per-line callables once per connection rather than looking them up for every line
+            read_line = self.reader.read_line
+            parse_mochad_line = self.parse_mochad_line
+            dispatch_message = self.dispatch_message
+            dispatch_time = self.dispatch_time
 
             # READ FROM NETWORK LOOP
-            while True:
-                line = self.reader.read_line()
+            while self.killer.kill_now == False:
+                # wake up twice a second so a shutdown is noticed even when mochad is quiet
+                try:
+                    line = read_line(0.5)
+                except OSError as e:
+                    # keepalive gave up on mochad (ETIMEDOUT) or the connection was reset; treat it like EOF
+                    self.logger.warning("Error reading from mochad: %s", e)
+                    break
+                if line is None:
+                    continue
                 # an empty string means connection lost, exit read loop
                 if not line:
                     break
                 # parse the line
                 try:
-                    addr, message_dict, kind = self.parse_mochad_line(line.rstrip())
+                    addr, message_dict, kind = parse_mochad_line(line)
                 except Exception as e:
-                    self.logger.error("Failed to parse mochad message {}: {}".format(line, e))
+                    self.logger.error("Failed to parse mochad message %s: %s", line, e)
                     continue
 
                 # addr/func will be blank when we have nothing to dispatch
                 if addr and message_dict:
                     # we don't to use mochad's timestamp because it lacks a year
-                    message_dict["dispatch_time"] = datetime.now(pytz.UTC).isoformat()
-                    self.dispatch_message(addr, message_dict, kind)
+                    message_dict["dispatch_time"] = dispatch_time()
+                    dispatch_message(addr, message_dict, kind)
+
+            if self.killer.kill_now:
+                break
 
             # we broke out of the read loop: we got disconnected, retry connect
-            self.logger.warn("Lost connection to mochad. Retrying.")
+            self.logger.warning("Lost connection to mochad. Retrying.")
             self.reconnect_time = time.time()
 
 
@@ -508,27 +865,27 @@ def daemon_main():
     """
     Main function which will be executed by Daemonize after initializing
     """
-    global main_logger, killer, args, dispatcher_type
+    global main_logger, killer, args, dispatcher_type, dispatch_uri
 
     main_logger.info("Start daemon_main()")
 
     try:
-        main_logger.debug(f"dispatcher_type({args.server}, {args.dispatch_uri}, logger, {args.cafile}), killer")
+        main_logger.debug("dispatcher_type(%s, %s, logger, %s), killer", args.server, dispatch_uri, args.cafile)
         dispatcher = dispatcher_type(
             args.server,
-            args.dispatch_uri,
+            dispatch_uri,
             main_logger,
             args.cafile,
             killer,
             args.legacy,
             args.mqtt_discovery,
         )
-        main_logger.debug("Created dispatcher: {}".format(dispatcher))
+        main_logger.debug("Created dispatcher: %s", dispatcher)
     except Exception as e:
         killer.errordie(f"Startup error: Could not create dispatcher {e}")
         exit(1)
 
-    main_logger.debug("Create Mochad Client: {}".format(dispatcher))
+    main_logger.debug("Create Mochad Client: %s", dispatcher)
     mochad_client = MochadClient(
         args.server,
         main_logger,
@@ -538,12 +895,6 @@ def daemon_main():
         args.legacy,
     )
 
-    main_logger.info("Start task dispatcher.watchdog()")
-    dispacther_watchdog_task_handle = threading.Thread(target=dispatcher.watchdog)
-    dispacther_watchdog_task_handle.daemon = True  # Daemon threads will shut down when the main process exits
-
-    dispacther_watchdog_task_handle.start()
-
     main_logger.info("Start task mochad_client.worker()")
     mochad_client_worker_task_handle = threading.Thread(target=mochad_client.worker)
     mochad_client_worker_task_handle.daemon = True  # Daemon threads will shut down when the main process exits
@@ -557,7 +908,7 @@ def main():
     """
     Main entry point into mochad_dispatch.  Processes command line arguments then hands off to Daemonize and MochadClient
     """
-    global args, dispatcher_type, main_logger, base_path, killer
+    global args, dispatcher_type, dispatch_uri, main_logger, base_path, killer
 
     killer = GracefulKiller()
 
@@ -628,15 +979,21 @@ def main():
     main_logger.addHandler(main_file_handler)
 
     main_logger.info("Starting mochad_dispatch")
-    main_logger.debug("args: {}".format(args))
+    # dispatch_uri may carry the broker password; daemon_main logs it once parsed, with the password hidden
+    main_logger.debug("args: %s", {k: v for k, v in vars(args).items() if k != "dispatch_uri"})
 
-    # set dispatcher type based on dispatch_uri
-    uri = urllib.parse.urlparse(args.dispatch_uri)
+    # parse dispatch_uri once up front; the dispatcher is handed the parsed settings
+    try:
+        dispatch_uri = parse_dispatch_uri(args.dispatch_uri)
+    except ValueError as e:
+        killer.errordie("invalid dispatch URI: {}".format(e))
+        exit(1)
 
-    if uri.scheme == "mqtt":
+    # set dispatcher type based on dispatch_uri
+    if dispatch_uri.scheme == "mqtt":
         dispatcher_type = MqttDispatcher
     else:
-        killer.errordie("unsupported URI scheme '{}'".format(uri.scheme))
+        killer.errordie("unsupported URI scheme '{}'".format(dispatch_uri.scheme))
 
     daemon_main()
 
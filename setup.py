@@ -4,7 +4,6 @@ VERSION = "1.0.0"
 
 REQUIRES = [
     "paho-mqtt",
-    "pytz",
 ]
 
 setup(
@@ -20,6 +19,7 @@ setup(
     long_description=open("README.rst").read(),
     zip_safe=False,
     install_requires=REQUIRES,
+    extras_require={"orjson": ["orjson"]},
     test_suite="tests",
     entry_points={"console_scripts": ["mochad_dispatch = mochad_dispatch.main:main"]},
     classifiers=[
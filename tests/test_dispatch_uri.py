@@ -0,0 +1,31 @@
+import pytest
+
+from mochad_dispatch.main import DispatchUri, parse_dispatch_uri
+
+
+def test_host_and_port():
+    assert parse_dispatch_uri("mqtt://mqtt.example.com:8883") == DispatchUri("mqtt.example.com", 8883)
+
+
+def test_scheme():
+    assert parse_dispatch_uri("mqtt://mqtt.example.com").scheme == "mqtt"
+    assert parse_dispatch_uri("http://mqtt.example.com").scheme == "http"
+
+
+def test_default_port():
+    assert parse_dispatch_uri("mqtt://mqtt.example.com") == DispatchUri("mqtt.example.com", 1883)
+
+
+def test_user_and_password():
+    uri = parse_dispatch_uri("mqtt://userpass.example.com:1883,user=theusername,pass=the=password")
+    assert uri == DispatchUri("userpass.example.com", 1883, "theusername", "the=password")
+    assert "the=password" not in repr(uri)
+
+
+def test_host_containing_user_and_pass():
+    assert parse_dispatch_uri("mqtt://userpass.example.com:1883") == DispatchUri("userpass.example.com", 1883)
+
+
+def test_unknown_parameter():
+    with pytest.raises(ValueError):
+        parse_dispatch_uri("mqtt://mqtt.example.com:1883,token=abc")
@@ -193,3 +193,9 @@ def test_known_funcs():
         result = MochadClient.decode_func(True, func_raw)
         print(func_dict, result)
         assert result == func_dict
+
+
+def test_decoded_func_is_a_copy():
+    result = MochadClient.decode_func(True, "Motion_alert_MS10A")
+    result["dispatch_time"] = "2016-09-22T15:39:07+00:00"
+    assert MochadClient.decode_func(True, "Motion_alert_MS10A") == MOCHAD_FUNCS["Motion_alert_MS10A"]
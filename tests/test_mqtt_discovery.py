@@ -0,0 +1,195 @@
+import json
+import logging
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from mochad_dispatch import main
+from mochad_dispatch.main import MqttDispatcher, _json_dumps, parse_dispatch_uri
+
+
+class StubSocket:
+    def setsockopt(self, *args):
+        pass
+
+
+class StubClient:
+    def __init__(self, *args, **kwargs):
+        self.published = []
+        self.subscribed = []
+
+    def max_queued_messages_set(self, queue_size):
+        pass
+
+    def connect(self, host, port):
+        return 0
+
+    def loop_start(self):
+        pass
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, qos, retain))
+        info = mqtt.MQTTMessageInfo(len(self.published))
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        return info
+
+    def subscribe(self, topic, qos=0):
+        self.subscribed.append((topic, qos))
+
+    def socket(self):
+        return StubSocket()
+
+
+@pytest.fixture(autouse=True)
+def stub_mqtt_client(monkeypatch):
+    monkeypatch.setattr(main.mqtt, "Client", StubClient)
+
+
+def make_dispatcher(legacy=False):
+    uri = parse_dispatch_uri("mqtt://127.0.0.1")
+    return MqttDispatcher("mochad", uri, logging.getLogger("test"), None, None, legacy, "homeassistant/ha")
+
+
+def retained_config(topic, payload):
+    message = mqtt.MQTTMessage(topic=topic.encode())
+    message.payload = payload
+    message.retain = True
+    return message
+
+
+def config_publishes(dispatcher):
+    return [p for p in dispatcher.mqttc.published if p[0].endswith("/config")]
+
+
+def state_publishes(dispatcher):
+    return [p for p in dispatcher.mqttc.published if not p[0].endswith("/config")]
+
+
+def wait_for_states(dispatcher, count):
+    deadline = time.monotonic() + 2
+    while len(state_publishes(dispatcher)) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return state_publishes(dispatcher)
+
+
+def test_on_connect_subscribes_to_discovery_configs():
+    dispatcher = make_dispatcher()
+    dispatcher.on_connect(dispatcher.mqttc, None, None, 0, None)
+    assert dispatcher.mqttc.subscribed == [("homeassistant/device/ha/+/config", 1)]
+
+
+def test_legacy_mode_does_not_subscribe():
+    dispatcher = make_dispatcher(legacy=True)
+    dispatcher.on_connect(dispatcher.mqttc, None, None, 0, None)
+    assert dispatcher.mqttc.subscribed == []
+
+
+def test_on_message_keys_retained_config_by_addr():
+    dispatcher = make_dispatcher()
+    dispatcher.on_message(dispatcher.mqttc, None, retained_config("homeassistant/device/ha/21:26:80/config", b"{}"))
+    dispatcher.on_message(dispatcher.mqttc, None, retained_config("homeassistant/device/other/B1/config", b"{}"))
+    assert dispatcher.retained_discovery == {"21:26:80": b"{}"}
+
+
+def test_identical_retained_config_is_not_republished():
+    first = make_dispatcher()
+    first.dispatch_mqtt_discovery("button", "B1")
+    [(topic, payload, qos, retain)] = config_publishes(first)
+    assert (topic, qos, retain) == ("homeassistant/device/ha/B1/config", 1, True)
+
+    dispatcher = make_dispatcher()
+    dispatcher.on_message(dispatcher.mqttc, None, retained_config(topic, payload))
+    dispatcher.dispatch_mqtt_discovery("button", "B1")
+    assert config_publishes(dispatcher) == []
+
+
+def test_changed_retained_config_is_republished():
+    dispatcher = make_dispatcher()
+    dispatcher.on_message(
+        dispatcher.mqttc, None, retained_config("homeassistant/device/ha/B1/config", b'{"state_topic":"old"}')
+    )
+    dispatcher.dispatch_mqtt_discovery("button", "B1")
+    [(topic, payload, qos, retain)] = config_publishes(dispatcher)
+    assert topic == "homeassistant/device/ha/B1/config"
+    assert payload != b'{"state_topic":"old"}'
+
+
+def test_first_state_waits_for_config_ack(monkeypatch):
+    monkeypatch.setattr(MqttDispatcher, "DISCOVERY_STATE_DELAY", 0)
+    dispatcher = make_dispatcher()
+    dispatcher.dispatch_message("B1", {"state": "ON"}, "button")
+    assert len(config_publishes(dispatcher)) == 1
+    assert state_publishes(dispatcher) == []
+
+    # config is the first publish, so the stub gave it mid 1
+    dispatcher.on_publish(dispatcher.mqttc, None, 1, None, None)
+    assert wait_for_states(dispatcher, 1) == [("X10/ha/button/B1", _json_dumps({"state": "ON"}), 0, False)]
+
+    # later states of a known device go straight out
+    dispatcher.dispatch_message("B1", {"state": "OFF"}, "button")
+    assert state_publishes(dispatcher)[-1] == ("X10/ha/button/B1", _json_dumps({"state": "OFF"}), 0, False)
+
+
+def test_config_acked_before_publish_returns(monkeypatch):
+    monkeypatch.setattr(MqttDispatcher, "DISCOVERY_STATE_DELAY", 0)
+    dispatcher = make_dispatcher()
+    publish = dispatcher.mqttc.publish
+
+    def publish_and_ack(topic, payload, qos=0, retain=False):
+        info = publish(topic, payload, qos, retain)
+        dispatcher.on_publish(dispatcher.mqttc, None, info.mid, None, None)
+        return info
+
+    dispatcher.mqttc.publish = publish_and_ack
+    dispatcher.dispatch_message("B1", {"state": "ON"}, "button")
+    assert wait_for_states(dispatcher, 1) == [("X10/ha/button/B1", _json_dumps({"state": "ON"}), 0, False)]
+    assert dispatcher.held_states == {}
+
+
+def test_later_states_queue_behind_held_state(monkeypatch):
+    monkeypatch.setattr(MqttDispatcher, "DISCOVERY_STATE_DELAY", 0.2)
+    dispatcher = make_dispatcher()
+    dispatcher.dispatch_message("21:26:80", {"event_state": "alert"}, "security")
+    dispatcher.dispatch_message("21:26:80", {"event_state": "tamper"}, "security")
+    dispatcher.on_publish(dispatcher.mqttc, None, 1, None, None)
+    dispatcher.dispatch_message("21:26:80", {"event_state": "normal"}, "security")
+    assert state_publishes(dispatcher) == []
+
+    states = wait_for_states(dispatcher, 3)
+    assert [json.loads(payload)["event_state"] for _, payload, _, _ in states] == ["alert", "tamper", "normal"]
+    assert dispatcher.held_states == {}
+
+    dispatcher.dispatch_message("21:26:80", {"event_state": "alert"}, "security")
+    assert len(state_publishes(dispatcher)) == 4
+
+
+def test_state_not_held_when_config_already_retained():
+    first = make_dispatcher()
+    first.dispatch_mqtt_discovery("button", "B1")
+    [(topic, payload, qos, retain)] = config_publishes(first)
+
+    dispatcher = make_dispatcher()
+    dispatcher.on_message(dispatcher.mqttc, None, retained_config(topic, payload))
+    dispatcher.dispatch_message("B1", {"state": "ON"}, "button")
+    assert dispatcher.mqttc.published == [("X10/ha/button/B1", _json_dumps({"state": "ON"}), 0, False)]
+
+
+def test_dropped_config_is_retried():
+    dispatcher = make_dispatcher()
+    publish = dispatcher.mqttc.publish
+
+    def queue_full(topic, payload, qos=0, retain=False):
+        info = publish(topic, payload, qos, retain)
+        info.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+        return info
+
+    dispatcher.mqttc.publish = queue_full
+    dispatcher.dispatch_message("B1", {"state": "ON"}, "button")
+    assert "B1" not in dispatcher.devices_discovered
+    assert dispatcher.held_states == {}
+
+    dispatcher.mqttc.publish = publish
+    dispatcher.dispatch_message("B1", {"state": "OFF"}, "button")
+    assert "B1" in dispatcher.devices_discovered
+    assert len(config_publishes(dispatcher)) == 2
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+import logging
+
+from mochad_dispatch.main import MochadClient
+
+
+def make_client(house_codes="ABCDEFGHIJKLMNOP", legacy=False):
+    return MochadClient("127.0.0.1", logging.getLogger("test"), None, house_codes, None, legacy)
+
+
+def test_rfsec_line():
+    client = make_client(legacy=True)
+    addr, func_dict, kind = client.parse_mochad_line(
+        b"09/22 15:39:07 Rx RFSEC Addr: 21:26:80 Func: Contact_alert_min_DS10A"
+    )
+    assert addr == "21:26:80"
+    assert kind == "security"
+    assert func_dict == {
+        "device_type": "DS10A",
+        "event_type": "contact",
+        "event_state": "alert",
+        "delay": "min",
+    }
+
+
+def test_rf_lines():
+    client = make_client()
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx RF HouseUnit: B1 Func: On") == (
+        "B1",
+        {"state": "ON"},
+        "button",
+    )
+    assert client.parse_mochad_line(b"12/15 21:30:45 Tx RF HouseUnit: A4 Func: Off") == (
+        "A4",
+        {"state": "OFF"},
+        "button",
+    )
+
+
+def test_rf_line_legacy_payload():
+    client = make_client(legacy=True)
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx RF HouseUnit: B1 Func: On") == (
+        "B1",
+        {"func": "On"},
+        "button",
+    )
+
+
+def test_pl_lines():
+    client = make_client()
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx PL House: B Func: On") == ("", "", "")
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx PL HouseUnit: B1") == ("", "", "")
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx PL House: B Func: On") == (
+        "B1",
+        {"state": "ON"},
+        "button",
+    )
+
+
+def test_filtered_house_codes():
+    client = make_client(house_codes="A")
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx RF HouseUnit: B1 Func: On") == ("", "", "")
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx PL HouseUnit: B1") == ("", "", "")
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx PL House: B Func: On") == ("", "", "")
+
+
+def test_padded_whitespace():
+    client = make_client()
+    assert client.parse_mochad_line(b"02/13 23:54:28 Rx RF  HouseUnit: B1\tFunc: On") == (
+        "B1",
+        {"state": "ON"},
+        "button",
+    )
+
+
+def test_unhandled_lines():
+    client = make_client()
+    assert client.parse_mochad_line(b"") == ("", "", "")
+    assert client.parse_mochad_line(b"02/13 23:54:28 Tx PL HouseUnit: B1") == ("", "", "")
+    assert client.parse_mochad_line(b"House B: 1") == ("", "", "")
+
+
+def test_dispatch_time_matches_isoformat():
+    client = make_client()
+    before = datetime.now(timezone.utc)
+    dispatch_time = datetime.fromisoformat(client.dispatch_time())
+    after = datetime.now(timezone.utc)
+    assert before <= dispatch_time <= after
+    assert dispatch_time.utcoffset() == timedelta(0)
@@ -0,0 +1,70 @@
+import socket
+
+from mochad_dispatch.main import SocketReader
+
+
+def make_reader():
+    reader = SocketReader("127.0.0.1", 1099)
+    reader.sock, peer = socket.socketpair()
+    return reader, peer
+
+
+def test_read_line_splits_buffered_lines():
+    reader, peer = make_reader()
+    peer.sendall(b"02/13 23:54:28 Rx RF HouseUnit: B1 Func: On\n02/13 23:54:29 Rx RF HouseUnit: B1 Func: Off\n")
+    assert reader.read_line() == b"02/13 23:54:28 Rx RF HouseUnit: B1 Func: On"
+    assert reader.read_line() == b"02/13 23:54:29 Rx RF HouseUnit: B1 Func: Off"
+    peer.close()
+    reader.close_connection()
+
+
+def test_read_line_joins_partial_reads():
+    reader, peer = make_reader()
+    peer.sendall(b"02/13 23:54:28 Rx PL ")
+    peer.sendall(b"HouseUnit: B1\r\n")
+    assert reader.read_line() == b"02/13 23:54:28 Rx PL HouseUnit: B1"
+    peer.close()
+    reader.close_connection()
+
+
+def test_read_line_returns_empty_at_eof():
+    reader, peer = make_reader()
+    peer.sendall(b"02/13 23:54:28 Rx PL House: B Func: On")
+    peer.close()
+    assert reader.read_line() == b"02/13 23:54:28 Rx PL House: B Func: On"
+    assert reader.read_line() == b""
+    reader.close_connection()
+
+
+def test_read_line_skips_blank_lines():
+    reader, peer = make_reader()
+    peer.sendall(b"\r\n\n02/13 23:54:28 Rx RF HouseUnit: B1 Func: On\r\n  \r\n")
+    assert reader.read_line() == b"02/13 23:54:28 Rx RF HouseUnit: B1 Func: On"
+    assert reader.read_line(timeout=0.01) is None
+    peer.close()
+    assert reader.read_line() == b""
+    reader.close_connection()
+
+
+def test_read_line_keeps_partial_line_across_refills():
+    reader, peer = make_reader()
+    line = b"09/22 15:39:07 Rx RFSEC Addr: 21:26:80 Func: Contact_alert_min_DS10A"
+    # enough whole lines to push the last one across the end of the buffer
+    count = SocketReader.BUFFER_SIZE // (len(line) + 1) + 2
+    peer.sendall((line + b"\n") * count)
+    peer.close()
+    for _ in range(count):
+        assert reader.read_line() == line
+    assert reader.read_line() == b""
+    reader.close_connection()
+
+
+def test_read_line_times_out_without_complete_line():
+    reader, peer = make_reader()
+    assert reader.read_line(timeout=0.01) is None
+    peer.sendall(b"02/13 23:54:28 Rx PL ")
+    assert reader.read_line(timeout=0.01) is None
+    peer.sendall(b"HouseUnit: B1\n")
+    assert reader.read_line(timeout=0.01) == b"02/13 23:54:28 Rx PL HouseUnit: B1"
+    peer.close()
+    reader.close_connection()
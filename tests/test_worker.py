@@ -0,0 +1,49 @@
+import logging
+
+from mochad_dispatch.main import MochadClient
+
+
+class StubKiller:
+    def __init__(self):
+        self.kill_now = False
+
+    def wait(self, timeout=None):
+        return self.kill_now
+
+    def do_kill_now(self):
+        self.kill_now = True
+
+
+class FailingReader:
+    def read_line(self, timeout=None):
+        # what recv_into raises once keepalive probes go unanswered
+        raise TimeoutError(110, "Connection timed out")
+
+
+class StoppingReader:
+    def __init__(self, killer):
+        self.killer = killer
+
+    def read_line(self, timeout=None):
+        self.killer.kill_now = True
+        return None
+
+
+class ScriptedClient(MochadClient):
+    def __init__(self, readers, killer):
+        super().__init__("127.0.0.1", logging.getLogger("test"), None, "ABCDEFGHIJKLMNOP", killer, False)
+        self.readers = readers
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        self.reader = self.readers.pop(0)
+
+
+def test_worker_reconnects_after_read_error(caplog):
+    killer = StubKiller()
+    client = ScriptedClient([FailingReader(), StoppingReader(killer)], killer)
+    with caplog.at_level(logging.WARNING):
+        client.worker()
+    assert client.connects == 2
+    assert "Error reading from mochad" in caplog.text